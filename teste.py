@@ -1,103 +1,191 @@
 # pip install pandas openpyxl
+# opcionais: orjson (parse de JSON mais rápido), xlsxwriter (gravação em streaming)
 from __future__ import annotations
 import json
+import re
 from pathlib import Path
 from typing import Any, Dict, List, Union
 
 import pandas as pd
 
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    # Um único decoder reaproveitado em todas as linhas
+    _json_loads = json.JSONDecoder().decode
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import pyarrow  # noqa: F401  (só para o dtype de texto em Arrow)
+    _TIPO_TEXTO = 'string[pyarrow]'
+except ImportError:
+    _TIPO_TEXTO = 'string'
+
 # ---------- helpers ----------
+# Regex compilada uma única vez (a função roda para cada linha).
+# O lookahead preserva o delimitador: ":," / ":}" / ":]" numa só passada
+_RE_EMPTY = re.compile(r':\s*(?=[,}\]])')
+# Trechos que indicam (ou podem indicar) valor vazio; sem nenhum deles a regex nunca casa
+_VAZIOS_SEM_ESPACO = (':,', ':}', ':]')
+_DOIS_PONTOS_ESPACO = (': ', ':\t', ':\n', ':\r', ':\f', ':\v')
+
 def limpar_json_invalido(json_str: str) -> str:
     """
     Remove campos com valores vazios que quebram o JSON.
     Ex: "emprestimosLegados":, vira "emprestimosLegados":null
     """
-    import re
-    # Substitui ":," por ":null,"
-    json_str = re.sub(r':\s*,', ':null,', json_str)
-    # Substitui ":}" por ":null}"
-    json_str = re.sub(r':\s*}', ':null}', json_str)
-    # Substitui ":]" por ":null]"
-    json_str = re.sub(r':\s*]', ':null]', json_str)
-    return json_str
+    # Caminho rápido: JSON bem formado (a maioria) volta sem passar pela regex
+    if not any(p in json_str for p in _VAZIOS_SEM_ESPACO) and \
+            not any(p in json_str for p in _DOIS_PONTOS_ESPACO):
+        return json_str
+    # Substitui ":," / ":}" / ":]" por ":null," / ":null}" / ":null]"
+    return _RE_EMPTY.sub(':null', json_str)
+
+# Chaves do JSON que geram colunas na saída
+_CHAVES_EXTRAIDAS = ('cbo', 'cnae', 'nome', 'cpf')
+
+def _celulas_json(coluna: pd.Series) -> pd.Series:
+    """
+    Indica, célula a célula, quais valores são textos que começam com '{' ou '['
+    (ignorando espaços). Usa os métodos .str do pandas sobre a coluna inteira.
+    """
+    # Colunas sem nenhum texto (só números, booleanos, vazias...) não têm JSON
+    if pd.api.types.infer_dtype(coluna, skipna=True) not in ('string', 'mixed', 'mixed-integer'):
+        return pd.Series(False, index=coluna.index)
+    return coluna.str.lstrip().str[:1].isin(('{', '['))
+
+def _formatar_codigo(codigo: Any, descricao: Any) -> str:
+    """Formata código e descrição como 'codigo - descricao' ('' sem código)."""
+    if not codigo:
+        return ''
+    return f"{codigo} - {descricao}"
+
+def _formatar_codigos(codigos: pd.Series, descricoes: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de _formatar_codigo para colunas inteiras.
+    Registros sem o campo (código nulo) continuam nulos.
+    """
+    texto = codigos.map(str) + ' - ' + descricoes.map(str)
+    return texto.where(codigos.astype(bool), codigos)
+
+def _extrair_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extrai CBO, CNAE e os outros campos úteis de um registro do JSON.
+    CBO e CNAE ficam em código/descrição separados ('CBO_codigo', 'CBO_descricao'...)
+    para serem formatados depois, em bloco.
+    """
+    resultado = {}
+    
+    # Extrai CBO e CNAE (códigos vazios viram '', que formata como '')
+    for chave, campo in (('cbo', 'CBO'), ('cnae', 'CNAE')):
+        sub = item.get(chave)
+        if isinstance(sub, dict):
+            resultado[f'{campo}_codigo'] = sub.get('codigo') or ''
+            resultado[f'{campo}_descricao'] = sub.get('descricao', '')
+    
+    # Extrai outros campos úteis (nome, cpf, etc)
+    if 'nome' in item:
+        resultado['Nome'] = item['nome']
+    if 'cpf' in item:
+        resultado['CPF'] = str(item['cpf'])
+    if 'nomeEmpregador' in item:
+        resultado['Empregador'] = item['nomeEmpregador']
+    
+    return resultado
+
+_ERROS_JSON = (json.JSONDecodeError, ValueError, AttributeError)
+
+def _carregar_json(json_str: str) -> Any:
+    """
+    Faz o parse com o parser rápido; se ele recusar (ex.: NaN/Infinity, que o
+    orjson não aceita), tenta de novo com o json da biblioteca padrão.
+    """
+    try:
+        return _json_loads(json_str)
+    except ValueError:
+        return json.loads(json_str)
+
+def _extrair_registros(json_str: str) -> List[Dict[str, Any]]:
+    """Faz o parse do JSON e devolve os registros no formato de _extrair_item."""
+    # Sem nenhuma das chaves procuradas não há o que extrair de cada item
+    # ("nome" também cobre "nomeEmpregador"), mas cada item ainda vira um
+    # registro vazio (a linha sai com as outras colunas)
+    tem_chaves = any(chave in json_str for chave in _CHAVES_EXTRAIDAS)
+    
+    try:
+        # Limpa JSON inválido antes de fazer parse
+        json_limpo = limpar_json_invalido(json_str.strip())
+        json_obj = _carregar_json(json_limpo)
+    except _ERROS_JSON:
+        # JSON inválido mesmo após a limpeza: retorna vazio
+        return []
+    
+    # Objeto único é tratado como lista de um item
+    itens = json_obj if isinstance(json_obj, list) else [json_obj]
+    if not tem_chaves:
+        return [{} for item in itens if isinstance(item, dict)]
+    return [_extrair_item(item) for item in itens if isinstance(item, dict)]
 
 def extrair_cbo_cnae_de_json(json_str: str) -> List[Dict[str, str]]:
     """
     Extrai todos os CBOs e CNAEs de um JSON (string ou array).
     Retorna lista de dicts com 'CBO' e 'CNAE' formatados.
     """
-    resultados = []
+    registros = _extrair_registros(json_str)
+    for reg in registros:
+        for campo in ('CBO', 'CNAE'):
+            if f'{campo}_codigo' in reg:
+                reg[campo] = _formatar_codigo(reg.pop(f'{campo}_codigo'), reg.pop(f'{campo}_descricao'))
+    return registros
+
+# Colunas extraídas do JSON, na ordem em que aparecem na saída
+CAMPOS_EXTRAIDOS = ('Nome', 'CPF', 'CBO', 'CNAE', 'Empregador')
+# Campos de _extrair_item (CBO/CNAE ainda separados em código e descrição)
+CAMPOS_BRUTOS = (
+    'Nome', 'CPF', 'CBO_codigo', 'CBO_descricao',
+    'CNAE_codigo', 'CNAE_descricao', 'Empregador',
+)
+# Tipos das colunas extraídas: texto contíguo em vez de objetos Python;
+# empregadores se repetem muito, então viram categoria
+TIPOS_EXTRAIDOS = {
+    'Nome': _TIPO_TEXTO,
+    'CPF': _TIPO_TEXTO,
+    'CBO': _TIPO_TEXTO,
+    'CNAE': _TIPO_TEXTO,
+    'Empregador': 'category',
+}
+
+def salvar_excel(df: pd.DataFrame, path_saida: Union[str, Path]) -> None:
+    """
+    Grava o DataFrame em .xlsx. Com xlsxwriter instalado usa o modo
+    constant_memory (linhas vão direto para o disco); senão, openpyxl.
+    """
+    if xlsxwriter is None:
+        df.to_excel(path_saida, index=False, engine='openpyxl')
+        return
     
+    # constant_memory exige escrita linha a linha; o pd.ExcelWriter grava
+    # coluna a coluna (perderia dados), então as linhas são escritas aqui
+    wb = xlsxwriter.Workbook(str(path_saida), {
+        'constant_memory': True,
+        'strings_to_urls': False,
+        # ±inf (ex.: 'inf' lido do CSV) vira #NUM! em vez de erro no write_number
+        'nan_inf_to_errors': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    })
     try:
-        # Limpa JSON inválido antes de fazer parse
-        json_limpo = limpar_json_invalido(json_str.strip())
-        
-        # Remove espaços e faz parse
-        json_obj = json.loads(json_limpo)
-        
-        # Se for lista, processa cada item
-        if isinstance(json_obj, list):
-            for item in json_obj:
-                if isinstance(item, dict):
-                    resultado = {}
-                    
-                    # Extrai CBO
-                    if 'cbo' in item and isinstance(item['cbo'], dict):
-                        cbo = item['cbo']
-                        codigo = cbo.get('codigo', '')
-                        descricao = cbo.get('descricao', '')
-                        resultado['CBO'] = f"{codigo} - {descricao}" if codigo else ''
-                    
-                    # Extrai CNAE
-                    if 'cnae' in item and isinstance(item['cnae'], dict):
-                        cnae = item['cnae']
-                        codigo = cnae.get('codigo', '')
-                        descricao = cnae.get('descricao', '')
-                        resultado['CNAE'] = f"{codigo} - {descricao}" if codigo else ''
-                    
-                    # Extrai outros campos úteis (nome, cpf, etc)
-                    if 'nome' in item:
-                        resultado['Nome'] = item['nome']
-                    if 'cpf' in item:
-                        resultado['CPF'] = str(item['cpf'])
-                    if 'nomeEmpregador' in item:
-                        resultado['Empregador'] = item['nomeEmpregador']
-                    
-                    resultados.append(resultado)
-        
-        # Se for objeto único
-        elif isinstance(json_obj, dict):
-            resultado = {}
-            
-            # Extrai CBO
-            if 'cbo' in json_obj and isinstance(json_obj['cbo'], dict):
-                cbo = json_obj['cbo']
-                codigo = cbo.get('codigo', '')
-                descricao = cbo.get('descricao', '')
-                resultado['CBO'] = f"{codigo} - {descricao}" if codigo else ''
-            
-            # Extrai CNAE
-            if 'cnae' in json_obj and isinstance(json_obj['cnae'], dict):
-                cnae = json_obj['cnae']
-                codigo = cnae.get('codigo', '')
-                descricao = cnae.get('descricao', '')
-                resultado['CNAE'] = f"{codigo} - {descricao}" if codigo else ''
-            
-            # Extrai outros campos úteis
-            if 'nome' in json_obj:
-                resultado['Nome'] = json_obj['nome']
-            if 'cpf' in json_obj:
-                resultado['CPF'] = str(json_obj['cpf'])
-            if 'nomeEmpregador' in json_obj:
-                resultado['Empregador'] = json_obj['nomeEmpregador']
-            
-            resultados.append(resultado)
-    
-    except Exception as e:
-        # Se falhar, retorna vazio
-        pass
-    
-    return resultados
+        ws = wb.add_worksheet()
+        cabecalho = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        ws.write_row(0, 0, [str(col) for col in df.columns], cabecalho)
+        for i, linha in enumerate(df.itertuples(index=False, name=None), start=1):
+            # NaN/NaT/NA/None viram células vazias
+            ws.write_row(i, 0, [None if v is None or v is pd.NA or v != v else v for v in linha])
+    finally:
+        wb.close()
 
 def excel_extrair_cbo_cnae(
     path_entrada: Union[str, Path],
@@ -112,73 +200,93 @@ def excel_extrair_cbo_cnae(
     # Lê o Excel original
     df = pd.read_excel(path_entrada, sheet_name=sheet)
     
-    todas_linhas = []
-    
-    for idx, row in df.iterrows():
-        # Procura especificamente pela coluna "Margens Prev"
-        if 'Margens Prev' in row and pd.notna(row['Margens Prev']):
-            valor = row['Margens Prev']
-            
-            if isinstance(valor, str):
-                valor_strip = valor.strip()
-                
-                # Se parece JSON
-                if (valor_strip.startswith('{') or valor_strip.startswith('[')):
-                    # Extrai CBOs e CNAEs
-                    registros = extrair_cbo_cnae_de_json(valor_strip)
-                    
-                    # Adiciona cada registro como uma linha
-                    for reg in registros:
-                        linha_nova = {}
-                        
-                        # Adiciona outras colunas da linha original (exceto a coluna de JSON)
-                        for col_name, col_val in row.items():
-                            if col_name != 'Margens Prev' and pd.notna(col_val):
-                                # Não adiciona se for JSON também
-                                if not (isinstance(col_val, str) and 
-                                       (col_val.strip().startswith('{') or col_val.strip().startswith('['))):
-                                    linha_nova[str(col_name)] = col_val
-                        
-                        # Adiciona os dados extraídos
-                        linha_nova.update(reg)
-                        todas_linhas.append(linha_nova)
+    # Procura especificamente pela coluna "Margens Prev"
+    if 'Margens Prev' in df.columns:
+        margens = df['Margens Prev']
+        # Só as células de texto que parecem JSON
+        eh_json = _celulas_json(margens)
+        # Extrai CBOs e CNAEs de uma vez; cada registro vira uma linha
+        # (o índice original é mantido para casar com as outras colunas)
+        registros = margens[eh_json].map(lambda s: _extrair_registros(s.strip()))
+        registros = registros.explode().dropna()
+    else:
+        registros = pd.Series(dtype=object)
     
     # Se não extraiu nada, retorna o Excel original
-    if not todas_linhas:
-        df.to_excel(path_saida, index=False, engine='openpyxl')
+    if registros.empty:
+        salvar_excel(df, path_saida)
         return len(df), len(df.columns)
     
-    # Cria DataFrame com todas as linhas extraídas
-    df_saida = pd.DataFrame(todas_linhas)
+    # Outras colunas da linha original (exceto a coluna de JSON), calculadas
+    # uma única vez e só para as linhas que geraram registros
+    colunas_outras = [col for col in df.columns if col != 'Margens Prev']
+    outras = df.loc[registros.index.unique(), colunas_outras]
+    outras.columns = outras.columns.map(str)
+    # Sem células JSON; só colunas de texto podem ter JSON (numéricas/datas nem são verificadas)
+    # e só as colunas que de fato têm alguma célula JSON passam pelo mask
+    texto = [col for col, tipo in outras.dtypes.items() if pd.api.types.is_string_dtype(tipo)]
+    sem_json = {}
+    for col in texto:
+        celulas_json = _celulas_json(outras[col])
+        if celulas_json.any():
+            sem_json[col] = outras[col].mask(celulas_json)
+    outras = outras.assign(**sem_json)
+    # Só ficam as colunas com algum valor
+    outras = outras.dropna(axis=1, how='all')
+    
+    # Monta tuplas com esquema fixo (só os campos que apareceram em algum
+    # registro) em vez de uma lista de dicts com chaves variadas.
+    # dtype=object mantém os códigos como vieram (sem virar float por causa de nulos)
+    registros_lista = registros.tolist()
+    presentes = set().union(*registros_lista)
+    brutos = [campo for campo in CAMPOS_BRUTOS if campo in presentes]
+    extraidos = pd.DataFrame(
+        [tuple(map(reg.get, brutos)) for reg in registros_lista],
+        columns=brutos,
+        index=registros.index,
+        dtype=object,
+    )
+    # Formata "codigo - descricao" de uma vez para a coluna inteira
+    for campo in ('CBO', 'CNAE'):
+        if f'{campo}_codigo' in extraidos.columns:
+            extraidos[campo] = _formatar_codigos(
+                extraidos.pop(f'{campo}_codigo'), extraidos.pop(f'{campo}_descricao')
+            )
+    campos = [campo for campo in CAMPOS_EXTRAIDOS if campo in extraidos.columns]
+    extraidos = extraidos[campos]
+    num_extraidas = len(extraidos)
+    
+    # Dados extraídos têm prioridade sobre colunas de mesmo nome
+    comuns = outras.columns.intersection(extraidos.columns)
+    for col in comuns:
+        extraidos[col] = extraidos[col].fillna(outras[col])
+    extraidos = extraidos.astype({campo: TIPOS_EXTRAIDOS[campo] for campo in campos})
     
     # Remove duplicatas baseado no nome (mantém a primeira ocorrência)
-    if 'Nome' in df_saida.columns:
-        df_saida = df_saida.drop_duplicates(subset=['Nome'], keep='first')
-    
-    # Reordena colunas para ter CBO e CNAE primeiro
-    colunas_desejadas = []
-    if 'Nome' in df_saida.columns:
-        colunas_desejadas.append('Nome')
-    if 'CPF' in df_saida.columns:
-        colunas_desejadas.append('CPF')
-    if 'CBO' in df_saida.columns:
-        colunas_desejadas.append('CBO')
-    if 'CNAE' in df_saida.columns:
-        colunas_desejadas.append('CNAE')
-    if 'Empregador' in df_saida.columns:
-        colunas_desejadas.append('Empregador')
-    
-    # Adiciona colunas restantes
-    for col in df_saida.columns:
-        if col not in colunas_desejadas:
-            colunas_desejadas.append(col)
-    
-    df_saida = df_saida[colunas_desejadas]
+    # antes de juntar as outras colunas, sem montar linhas que seriam descartadas.
+    # Sem 'nome' nos registros, vale a coluna Nome da própria planilha
+    if 'Nome' in extraidos.columns:
+        nomes = extraidos['Nome']
+    elif 'Nome' in outras.columns:
+        nomes = outras['Nome'].loc[extraidos.index]
+    else:
+        nomes = None
+    if nomes is not None:
+        extraidos = extraidos[~nomes.duplicated(keep='first').to_numpy()]
+    
+    outras = outras.drop(columns=comuns).loc[extraidos.index]
+    df_saida = pd.concat(
+        [extraidos.reset_index(drop=True), outras.reset_index(drop=True)], axis=1
+    )
+    # Nome, CPF, CBO, CNAE e Empregador primeiro (extraídos ou da planilha),
+    # depois as colunas restantes
+    primeiras = [campo for campo in CAMPOS_EXTRAIDOS if campo in df_saida.columns]
+    df_saida = df_saida[primeiras + [col for col in df_saida.columns if col not in primeiras]]
     
     # Salva em Excel
-    df_saida.to_excel(path_saida, index=False, engine='openpyxl')
+    salvar_excel(df_saida, path_saida)
     
-    return len(todas_linhas), len(df_saida.columns)
+    return num_extraidas, len(df_saida.columns)
 
 # ---------- uso direto ----------
 if __name__ == "__main__":
@@ -196,8 +304,12 @@ if __name__ == "__main__":
         print(f"✅ Pasta criada! Coloque seus arquivos Excel (.xlsx, .xls) dentro de: {pasta_leiame}")
         exit(0)
     
-    # Busca todos os arquivos Excel na pasta
-    arquivos_excel = list(pasta_leiame.glob("*.xlsx")) + list(pasta_leiame.glob("*.xls"))
+    # Busca todos os arquivos Excel na pasta (uma só varredura, extensão sem diferenciar maiúsculas)
+    with os.scandir(pasta_leiame) as entradas:
+        arquivos_excel = [
+            Path(entrada.path) for entrada in entradas
+            if entrada.is_file() and entrada.name.lower().endswith(('.xlsx', '.xls'))
+        ]
     
     if not arquivos_excel:
         print(f"❌ Nenhum arquivo Excel encontrado na pasta: {pasta_leiame}")
@@ -206,25 +318,36 @@ if __name__ == "__main__":
     
     print(f"📂 Encontrados {len(arquivos_excel)} arquivo(s) Excel na pasta 'leiame':\n")
     
-    # Processa cada arquivo encontrado
-    for arquivo in arquivos_excel:
-        print(f"📄 Processando: {arquivo.name}")
-        try:
+    # Processa os arquivos em paralelo (um processo por arquivo, até o nº de CPUs)
+    import time
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    max_workers = min(len(arquivos_excel), os.cpu_count() or 1)
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {}
+        for arquivo in arquivos_excel:
+            print(f"📄 Processando: {arquivo.name}")
             # Nome do arquivo de saída baseado no arquivo de entrada + timestamp
-            import time
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
             nome_saida = f"{arquivo.stem}_CBO_CNAE_{timestamp}.xlsx"
             caminho_saida = script_dir / nome_saida
-            
-            num_linhas, num_colunas = excel_extrair_cbo_cnae(arquivo, caminho_saida, sheet=0)
-            
-            print(f"   ✅ {num_linhas} linhas processadas")
-            print(f"   📊 Extraído CBO e CNAE em '{nome_saida}'\n")
-            
-        except Exception as e:
-            import traceback
-            print(f"   ❌ Erro ao processar {arquivo.name}: {e}")
-            traceback.print_exc()
-            print()
+            futuro = executor.submit(excel_extrair_cbo_cnae, arquivo, caminho_saida, 0)
+            futuros[futuro] = (arquivo, nome_saida)
+        print()
+        
+        for futuro in as_completed(futuros):
+            arquivo, nome_saida = futuros[futuro]
+            try:
+                num_linhas, num_colunas = futuro.result()
+                
+                print(f"✅ {arquivo.name}: {num_linhas} linhas processadas")
+                print(f"   📊 Extraído CBO e CNAE em '{nome_saida}'\n")
+                
+            except Exception as e:
+                import traceback
+                print(f"   ❌ Erro ao processar {arquivo.name}: {e}")
+                traceback.print_exc()
+                print()
     
     print("🎉 Processamento concluído!")
@@ -9,6 +9,7 @@ Coloque os arquivos Excel na pasta `leiame/` ao lado deste repositório e execut
 Saída: gera um arquivo Excel com os campos normalizados e colunas extras para CBO/CNAE.
 """
 from __future__ import annotations
+import functools
 import json
 import os
 import re
@@ -16,11 +17,32 @@ import shutil
 import subprocess
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import freeze_support
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import pandas as pd
 
+try:
+    # parser em Rust, bem mais rápido; sem ele usa o json da biblioteca padrão
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    # gravação de .xlsx em streaming; sem ele grava com openpyxl
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    # leitor de Excel em Rust (pandas >= 2.2); sem ele o pandas usa o openpyxl
+    import python_calamine  # noqa: F401
+    _ENGINE_EXCEL: Optional[str] = 'calamine'
+except ImportError:
+    _ENGINE_EXCEL = None
+
 
 def encontrar_base_dir():
     """
@@ -75,14 +97,22 @@ def aguardar_enter():
     input("\n⏎ Pressione ENTER para continuar...")
 
 
-def fechar_excel():
-    """Verifica se o Excel está aberto e pergunta se quer fechar"""
+def fechar_excel(*arquivos):
+    """Verifica se algum dos arquivos (saída e backup) está aberto (travado pelo Excel) e pergunta se quer fechar"""
     try:
         print("🔄 Verificando se o Excel está aberto...")
-        result = subprocess.run(['tasklist', '/FI', 'IMAGENAME eq EXCEL.EXE'], 
-                              capture_output=True, text=True, shell=True)
+        # Sonda a trava do arquivo direto, sem subprocesso (tasklist): o Excel
+        # abre a planilha em modo exclusivo, então abrir para escrita falha
+        aberto = False
+        for arquivo in arquivos:
+            if arquivo.exists():
+                try:
+                    os.close(os.open(str(arquivo), os.O_RDWR))
+                except PermissionError:
+                    aberto = True
+                    break
         
-        if 'EXCEL.EXE' in result.stdout:
+        if aberto:
             print("\n⚠️  ATENÇÃO: Excel está aberto!")
             print("⚠️  Para evitar erros, é recomendado fechar o Excel antes de continuar.")
             print("⚠️  Todas as planilhas abertas serão fechadas (SALVE SEU TRABALHO!).")
@@ -95,8 +125,7 @@ def fechar_excel():
             
             if resposta == '1':
                 print("📊 Fechando Excel...")
-                subprocess.run(['taskkill', '/F', '/IM', 'EXCEL.EXE'], 
-                             capture_output=True, shell=True)
+                subprocess.run(['taskkill', '/F', '/IM', 'EXCEL.EXE'], capture_output=True)
                 time.sleep(2)  # Aguarda o Excel fechar completamente
                 print("✅ Excel fechado com sucesso!")
                 return 'fechado'
@@ -107,7 +136,7 @@ def fechar_excel():
                 print("❌ Operação cancelada pelo usuário.")
                 return 'cancelado'
         else:
-            print("✅ Excel não está aberto.")
+            print("✅ Arquivo de saída e backup não estão abertos no Excel.")
             return 'livre'
     except Exception as e:
         print(f"⚠️ Erro ao verificar Excel: {e}")
@@ -118,18 +147,22 @@ def criar_arquivo_temporario(script_dir, arquivo_entrada, pasta_lidos):
     """Cria arquivo temporário para visualização sem afetar arquivos abertos"""
     try:
         from datetime import datetime
-        import glob
         
-        # Limpa arquivos temporários antigos primeiro
+        # Limpa arquivos temporários antigos primeiro (uma varredura com scandir,
+        # sem print por arquivo; temporários ainda abertos no Excel ficam para depois)
         print(f"\n🧹 Limpando arquivos temporários antigos...")
-        temp_files = glob.glob(str(script_dir / "relatorio_propostas_TEMP_*.xlsx"))
-        if temp_files:
-            for temp_file in temp_files:
-                try:
-                    os.remove(temp_file)
-                    print(f"   🗑️ Removido: {os.path.basename(temp_file)}")
-                except Exception as e:
-                    print(f"   ⚠️ Não foi possível remover {os.path.basename(temp_file)}: {e}")
+        with os.scandir(script_dir) as it:
+            temps = [e.path for e in it
+                     if e.name.startswith('relatorio_propostas_TEMP_') and e.name.endswith('.xlsx')]
+        removidos = 0
+        for temp in temps:
+            try:
+                os.unlink(temp)
+                removidos += 1
+            except OSError:
+                pass
+        if temps:
+            print(f"   🗑️ Removidos {removidos} de {len(temps)} temporário(s)")
             print(f"✅ Limpeza concluída!")
         else:
             print(f"✅ Nenhum arquivo temporário antigo encontrado.")
@@ -285,8 +318,9 @@ def processar_arquivo_menu(script_dir, pasta_leiame, pasta_lidos):
     exibir_banner()
     print("🔄 PROCESSAR ARQUIVO\n")
     
-    # Verifica se Excel está aberto
-    status_excel = fechar_excel()
+    # Verifica se o arquivo de saída (ou o backup, que será substituído) está aberto no Excel
+    status_excel = fechar_excel(script_dir / "relatorio_propostas_formatado.xlsx",
+                                script_dir / "backup" / "relatorio_propostas_formatado.xlsx")
     if status_excel == 'cancelado':
         print("\n❌ Operação cancelada.")
         aguardar_enter()
@@ -346,15 +380,15 @@ def processar_arquivo_menu(script_dir, pasta_leiame, pasta_lidos):
         pasta_backup.mkdir(exist_ok=True)
         print("📁 Pasta de backup criada")
     
-    # Se já existe um arquivo formatado, move para backup (substituindo o backup anterior)
-    if saida.exists():
-        backup_path = pasta_backup / "relatorio_propostas_formatado.xlsx"
-        if backup_path.exists():
-            backup_path.unlink()  # Remove backup antigo
-        shutil.move(str(saida), str(backup_path))
-        print("📦 Backup do arquivo anterior criado")
-    
     try:
+        # Se já existe um arquivo formatado, move para backup (substituindo o backup anterior)
+        if saida.exists():
+            backup_path = pasta_backup / "relatorio_propostas_formatado.xlsx"
+            if backup_path.exists():
+                backup_path.unlink()  # Remove backup antigo
+            shutil.move(str(saida), str(backup_path))
+            print("📦 Backup do arquivo anterior criado")
+        
         processar_arquivo(arquivo, saida)
         
         print("\n" + "=" * 70)
@@ -390,23 +424,24 @@ def processar_arquivo_menu(script_dir, pasta_leiame, pasta_lidos):
     aguardar_enter()
 
 
+# :, :} e :] numa só passada (o lookahead preserva o delimitador)
+_RE_VALOR_VAZIO = re.compile(r':\s*(?=[,}\]])')
+
+
 def limpar_json_invalido(json_str: str) -> str:
     """Tenta consertar pedaços comuns que tornam o JSON inválido.
     Exemplos: 'emprestimosLegados':,  -> 'emprestimosLegados':null,
     """
-    s = json_str
     # substitui :,, :} and :] patterns
-    s = re.sub(r':\s*,', ':null,', s)
-    s = re.sub(r':\s*}', ':null}', s)
-    s = re.sub(r':\s*]', ':null]', s)
+    s = _RE_VALOR_VAZIO.sub(':null', json_str)
     # remove caracteres de controle estranhos (se houver)
     s = s.replace('\x00', '')
     return s
 
 
-def safe_load_json(s: str) -> Optional[Union[Dict[str, Any], List[Any]]]:
+def _carregar_json(s: str) -> Optional[Union[Dict[str, Any], List[Any]]]:
     try:
-        return json.loads(s)
+        return _json_loads(s)
     except Exception:
         try:
             s2 = limpar_json_invalido(s)
@@ -415,21 +450,31 @@ def safe_load_json(s: str) -> Optional[Union[Dict[str, Any], List[Any]]]:
             return None
 
 
-def extrair_registros_de_margens(margens_val: Any) -> List[Dict[str, Any]]:
-    """Dado o valor da coluna 'Margens Prev' (str com JSON, lista ou dict), retorna lista de registros tratados."""
-    if pd.isna(margens_val) or margens_val is None:
-        return []
-    # se já é lista/dict
-    if isinstance(margens_val, (list, dict)):
-        parsed = margens_val
-    elif isinstance(margens_val, str):
-        parsed = safe_load_json(margens_val.strip())
-    else:
-        parsed = None
+# o mesmo JSON (ex.: motivo padrão) se repete em milhares de linhas
+_carregar_json_cache = functools.lru_cache(maxsize=10_000)(_carregar_json)
+
+
+def safe_load_json(s: str) -> Optional[Union[Dict[str, Any], List[Any]]]:
+    """Carrega o JSON, reaproveitando o resultado de textos já vistos.
+    O objeto devolvido é compartilhado entre chamadas iguais: não modifique.
+    """
+    if isinstance(s, str):
+        return _carregar_json_cache(s)
+    return _carregar_json(s)
+
+
+def valor_json(val: Any) -> Any:
+    """Devolve o valor já como JSON: dict/list passam direto (sem tocar no parser),
+    str é carregada via safe_load_json; qualquer outra coisa (NaN/None) vira None."""
+    if isinstance(val, (dict, list)):
+        return val
+    if isinstance(val, str):
+        return safe_load_json(val.strip())
+    return None
 
-    if parsed is None:
-        return []
 
+def _registros_validos(parsed: Any) -> List[Dict[str, Any]]:
+    """Normaliza o JSON já carregado em lista de registros (apenas objetos dict)."""
     if isinstance(parsed, dict):
         return [parsed]
     if isinstance(parsed, list):
@@ -438,102 +483,238 @@ def extrair_registros_de_margens(margens_val: Any) -> List[Dict[str, Any]]:
     return []
 
 
-def mapear_linha(row: pd.Series, margem_item: Dict[str, Any]) -> Dict[str, Any]:
-    """Cria um dict plano combinando colunas top-level e campos extraídos do item de margem."""
-    out: Dict[str, Any] = {}
-    # Copia colunas top-level relevantes (se existirem)
-    for col in row.index:
-        if col == 'Margens Prev':
-            continue
-        val = row[col]
-        if pd.notna(val):
-            out[str(col)] = val
+def _motivo_valido(parsed: Any) -> Tuple[Optional[int], Optional[str]]:
+    """Extrai (codigo, descricao) do JSON já carregado do motivo."""
+    if isinstance(parsed, dict):
+        return parsed.get('codigo'), parsed.get('descricao')
+    return None, None
 
-    # Extrai campos do item de margem (cbo, cnae, nome, cpf, empregador, valores)
-    cbo = margem_item.get('cbo') if isinstance(margem_item.get('cbo'), dict) else None
-    cnae = margem_item.get('cnae') if isinstance(margem_item.get('cnae'), dict) else None
 
-    if cbo:
-        out['MargensPrev_CBO_Codigo'] = cbo.get('codigo')
-        out['MargensPrev_CBO_Descricao'] = cbo.get('descricao')
-    if cnae:
-        out['MargensPrev_CNAE_Codigo'] = cnae.get('codigo')
-        out['MargensPrev_CNAE_Descricao'] = cnae.get('descricao')
+def extrair_registros_de_margens(margens_val: Any) -> List[Dict[str, Any]]:
+    """Dado o valor da coluna 'Margens Prev' (str com JSON, lista ou dict), retorna lista de registros tratados."""
+    return _registros_validos(valor_json(margens_val))
+
 
-    # Outros campos do registro interno
-    for k in ('nome', 'cpf', 'nomeEmpregador', 'valorMargemDisponivel', 'valorBaseMargem'):
-        if k in margem_item:
-            out[f'MargensPrev_{k}'] = margem_item.get(k)
+def extrair_motivo_inelegibilidade(val: Any) -> Tuple[Optional[int], Optional[str]]:
+    return _motivo_valido(valor_json(val))
 
-    return out
 
+def _extrair_celula(entrada: Tuple[bool, Any]) -> Any:
+    """Extrai uma célula do lote único de JSONs: (True, valor) é de margens e vira
+    a lista de registros; (False, valor) é de motivo e vira (codigo, descricao).
+    A redução acontece aqui (no processo que fez o parse), para só o resultado
+    pequeno voltar ao processo principal, e não a árvore JSON inteira."""
+    eh_margem, val = entrada
+    parsed = valor_json(val)
+    return _registros_validos(parsed) if eh_margem else _motivo_valido(parsed)
 
-def extrair_motivo_inelegibilidade(val: Any) -> Tuple[Optional[int], Optional[str]]:
-    if pd.isna(val) or val is None:
-        return None, None
-    if isinstance(val, str):
-        parsed = safe_load_json(val.strip())
-        if isinstance(parsed, dict):
-            return parsed.get('codigo'), parsed.get('descricao')
-        return None, None
-    if isinstance(val, dict):
-        return val.get('codigo'), val.get('descricao')
-    return None, None
+
+def salvar_excel(df: pd.DataFrame, path_saida: Union[str, Path]) -> None:
+    """Grava o DataFrame em .xlsx; com xlsxwriter usa o modo constant_memory
+    (cada linha vai direto para o disco, memória não cresce com o tamanho)."""
+    if xlsxwriter is None:
+        df.to_excel(path_saida, index=False, engine='openpyxl')
+        return
+
+    # constant_memory exige gravar linha a linha; o pd.ExcelWriter grava
+    # coluna a coluna (perderia dados), por isso as linhas são escritas aqui
+    wb = xlsxwriter.Workbook(str(path_saida), {
+        'constant_memory': True,
+        'strings_to_numbers': False,
+        'strings_to_urls': False,
+        # ±inf (ex.: 'inf' lido do CSV) vira #NUM! em vez de erro no write_number
+        'nan_inf_to_errors': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    })
+    try:
+        ws = wb.add_worksheet()
+        cabecalho = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        ws.write_row(0, 0, [str(c) for c in df.columns], cabecalho)
+        for i, linha in enumerate(df.itertuples(index=False, name=None), start=1):
+            # NaN/NaT/NA/None viram células vazias
+            ws.write_row(i, 0, [None if v is None or v is pd.NA or v != v else v for v in linha])
+    finally:
+        wb.close()
+
+
+# Variações aceitas para os nomes das colunas com JSON
+COLUNAS_MARGENS = ('Margens Prev', 'MargensPrev', 'Margens_Prev')
+COLUNAS_MOTIVO = ('Motivo Inelegibilidade', 'MotivoInelegibilidade', 'Motivo')
+
+# Campos do item de margem que viram colunas na saída
+COLUNAS_CBO = ['MargensPrev_CBO_Codigo', 'MargensPrev_CBO_Descricao']
+COLUNAS_CNAE = ['MargensPrev_CNAE_Codigo', 'MargensPrev_CNAE_Descricao']
+CAMPOS_ITEM_MARGEM = ('nome', 'cpf', 'nomeEmpregador', 'valorMargemDisponivel', 'valorBaseMargem')
+COLUNAS_MOTIVO_SAIDA = ['MotivoInelegibilidade_Codigo', 'MotivoInelegibilidade_Descricao']
+
+# Tipos das colunas extraídas na saída (em vez de object: menos memória e o
+# xlsxwriter grava números como números)
+TIPOS_SAIDA = {
+    'MargensPrev_CBO_Codigo': 'Int64',
+    'MargensPrev_CNAE_Codigo': 'Int64',
+    'MotivoInelegibilidade_Codigo': 'Int64',
+    'MargensPrev_valorMargemDisponivel': 'float64',
+    'MargensPrev_valorBaseMargem': 'float64',
+}
+
+
+def encontrar_coluna(df: pd.DataFrame, candidatos: Tuple[str, ...]) -> Optional[str]:
+    """Retorna o primeiro nome de `candidatos` que existe no DataFrame (ou None)."""
+    colunas = set(df.columns)
+    return next((c for c in candidatos if c in colunas), None)
+
+
+def extrair_campos_margem(itens: List[Dict[str, Any]], index: pd.Index) -> pd.DataFrame:
+    """Monta as colunas MargensPrev_* (cbo, cnae, nome, cpf, empregador, valores),
+    uma linha por item de margem. As linhas são tuplas com colunas fixas, sem
+    o alinhamento de chaves de um DataFrame montado a partir de dicts.
+    (pd.json_normalize, mesmo com max_level=1, percorre todas as chaves de cada
+    item e fica ~25x mais lento aqui.)"""
+    colunas_item = [f'MargensPrev_{k}' for k in CAMPOS_ITEM_MARGEM]
+    # uma linha por item: a lista já nasce do tamanho final (sem realocações)
+    linhas: List[Optional[Tuple[Any, ...]]] = [None] * len(itens)
+    tem_cbo = tem_cnae = False
+    vazio: Dict[str, Any] = {}  # um só dict vazio para itens sem cbo/cnae
+    for i, item in enumerate(itens):
+        cbo = item.get('cbo')
+        if not isinstance(cbo, dict):
+            cbo = vazio
+        elif cbo:
+            tem_cbo = True
+        cnae = item.get('cnae')
+        if not isinstance(cnae, dict):
+            cnae = vazio
+        elif cnae:
+            tem_cnae = True
+        linhas[i] = ((cbo.get('codigo'), cbo.get('descricao'), cnae.get('codigo'), cnae.get('descricao'))
+                     + tuple(map(item.get, CAMPOS_ITEM_MARGEM)))
+    campos = pd.DataFrame(linhas, columns=COLUNAS_CBO + COLUNAS_CNAE + colunas_item, index=index)
+
+    # só entram as colunas de campos que apareceram em algum item
+    presentes = set().union(*itens)
+    manter = (COLUNAS_CBO if tem_cbo else []) + (COLUNAS_CNAE if tem_cnae else [])
+    manter += [col for k, col in zip(CAMPOS_ITEM_MARGEM, colunas_item) if k in presentes]
+    return campos[manter]
+
+
+# A partir de quantas linhas o parse dos JSONs é dividido entre processos
+# (abaixo disso o custo de subir os processos não compensa)
+MIN_LINHAS_PARALELO = 20_000
+
+
+def mapear_em_paralelo(serie: pd.Series, funcao) -> pd.Series:
+    """Aplica `funcao` (função de módulo) a cada valor da série.
+    Séries grandes são processadas em lotes por vários processos."""
+    if len(serie) < MIN_LINHAS_PARALELO or (os.cpu_count() or 1) < 2:
+        return serie.map(funcao)
+    with ProcessPoolExecutor() as executor:
+        resultado = list(executor.map(funcao, serie.tolist(), chunksize=2048))
+    return pd.Series(resultado, index=serie.index, dtype=object)
+
+
+def _celulas_json(col: pd.Series) -> pd.Series:
+    """Marca as células de texto que começam com '{' ou '[' (ignorando espaços à esquerda)."""
+    # colunas sem texto (números, datas, vazias...) não têm JSON
+    if pd.api.types.infer_dtype(col, skipna=True) not in ('string', 'mixed', 'mixed-integer'):
+        return pd.Series(False, index=col.index)
+    return col.str.lstrip().str[:1].isin(('{', '['))
+
+
+def tipar_colunas_saida(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte as colunas extraídas para os tipos de TIPOS_SAIDA. Só entram colunas
+    que já são só números: uma com algum texto (ex.: código "0111301") ou valor
+    fora do tipo fica como está, sem perder dados."""
+    tipos = {}
+    for col, tipo in TIPOS_SAIDA.items():
+        if col not in df.columns:
+            continue
+        if pd.api.types.infer_dtype(df[col], skipna=True) not in ('integer', 'floating', 'mixed-integer-float'):
+            continue
+        try:
+            tipos[col] = df[col].astype(tipo)
+        except (ValueError, TypeError):
+            pass
+    return df.assign(**tipos) if tipos else df
 
 
 def processar_arquivo(path_entrada: Union[str, Path], path_saida: Union[str, Path]):
     # Detecta se é CSV ou Excel
     if str(path_entrada).endswith('.csv'):
-        df = pd.read_csv(path_entrada, encoding='utf-8', on_bad_lines='skip')
+        # colunas JSON são sempre texto: pula a inferência de tipo nelas. Só as
+        # variações que de fato serão usadas (lidas do cabeçalho); as demais,
+        # como uma coluna 'Motivo' numérica ao lado da de JSON, mantêm o tipo
+        cabecalho = pd.read_csv(path_entrada, encoding='utf-8', nrows=0)
+        colunas_json = (encontrar_coluna(cabecalho, COLUNAS_MARGENS), encontrar_coluna(cabecalho, COLUNAS_MOTIVO))
+        df = pd.read_csv(path_entrada, encoding='utf-8', on_bad_lines='skip', engine='c',
+                         low_memory=False, dtype={c: str for c in colunas_json if c is not None})
     else:
-        df = pd.read_excel(path_entrada, sheet_name=0)
-
-    linhas_saida: List[Dict[str, Any]] = []
-
-    for _, row in df.iterrows():
-        # pega especificamente a coluna 'Margens Prev' (tolerância a variações)
-        col_margens = None
-        for candidate in ['Margens Prev', 'MargensPrev', 'Margens_Prev']:
-            if candidate in row.index:
-                col_margens = candidate
-                break
-
-        margem_val = row[col_margens] if col_margens else None
-
-        registros = extrair_registros_de_margens(margem_val)
-        # extrai motivo inelegibilidade (se houver)
-        motivo_codigo, motivo_desc = None, None
-        for candidate in ['Motivo Inelegibilidade', 'MotivoInelegibilidade', 'Motivo']:
-            if candidate in row.index:
-                motivo_codigo, motivo_desc = extrair_motivo_inelegibilidade(row[candidate])
-                break
-
-        if registros:
-            for reg in registros:
-                mapped = mapear_linha(row, reg)
-                if motivo_codigo is not None or motivo_desc is not None:
-                    mapped['MotivoInelegibilidade_Codigo'] = motivo_codigo
-                    mapped['MotivoInelegibilidade_Descricao'] = motivo_desc
-                linhas_saida.append(mapped)
-        else:
-            # nenhuma margem interna: ainda assim mantém a linha (com colunas top-level)
-            out = {}
-            for col in row.index:
-                val = row[col]
-                if pd.notna(val) and not (isinstance(val, str) and (val.strip().startswith('{') or val.strip().startswith('['))):
-                    out[str(col)] = val
-            if motivo_codigo is not None or motivo_desc is not None:
-                out['MotivoInelegibilidade_Codigo'] = motivo_codigo
-                out['MotivoInelegibilidade_Descricao'] = motivo_desc
-            if out:
-                linhas_saida.append(out)
-
-    if not linhas_saida:
+        df = pd.read_excel(path_entrada, sheet_name=0, engine=_ENGINE_EXCEL)
+
+    # pega as colunas 'Margens Prev' e 'Motivo Inelegibilidade' (tolerância a variações),
+    # resolvidas uma única vez para o arquivo todo
+    col_margens = encontrar_coluna(df, COLUNAS_MARGENS)
+    col_motivo = encontrar_coluna(df, COLUNAS_MOTIVO)
+
+    # parse dos JSONs das duas colunas num único lote (um só pool de processos);
+    # cada valor vai marcado com a coluna de origem. Células vazias nem passam pelo parser
+    vazia = pd.Series([], dtype=object)
+    margens_val = df[col_margens].dropna() if col_margens is not None else vazia
+    motivo_val = df[col_motivo].dropna() if col_motivo is not None else vazia
+    entradas = pd.Series([(True, v) for v in margens_val.tolist()]
+                         + [(False, v) for v in motivo_val.tolist()], dtype=object)
+    extraidos = mapear_em_paralelo(entradas, _extrair_celula).tolist()
+    n_margens = len(margens_val)
+
+    # registros de margem (lista de dicts) das linhas que têm algum
+    registros = pd.Series(extraidos[:n_margens], index=margens_val.index, dtype=object)
+    registros = registros[registros.map(len).astype(bool)]
+    tem_registros = df.index.isin(registros.index)
+
+    # motivo inelegibilidade (se houver) de cada linha
+    motivos = pd.DataFrame(extraidos[n_margens:], index=motivo_val.index,
+                           columns=COLUNAS_MOTIVO_SAIDA).reindex(df.index)
+    # JSONs já extraídos: libera o cache para o próximo arquivo
+    _carregar_json_cache.cache_clear()
+
+    top = df.set_axis(df.columns.map(str), axis=1)
+
+    # linhas com margens: uma linha por registro, com as colunas top-level
+    # e os campos extraídos do item de margem
+    explodido = registros.explode()
+    campos = extrair_campos_margem(explodido.tolist(), explodido.index)
+    # posições (array numpy) da linha de origem de cada registro e das colunas
+    # copiadas: um único iloc posicional, sem busca por rótulo nem cópias intermediárias
+    origem = top.index.get_indexer(explodido.index)
+    colunas_copiadas = [i for i, c in enumerate(df.columns) if c != col_margens]
+    linhas_margens = pd.concat([
+        top.iloc[origem, colunas_copiadas],
+        campos,
+        motivos.iloc[origem],
+    ], axis=1)
+
+    # nenhuma margem interna: ainda assim mantém a linha (com colunas top-level que não são JSON)
+    sem_margens = top.loc[~tem_registros]
+    sem_json = {}
+    for col in sem_margens.columns:
+        celulas_json = _celulas_json(sem_margens[col])
+        if celulas_json.any():
+            sem_json[col] = sem_margens[col].mask(celulas_json)
+    sem_margens = sem_margens.assign(**sem_json)
+    linhas_sem_margens = pd.concat([sem_margens, motivos.loc[sem_margens.index]], axis=1).dropna(how='all')
+
+    # mantém a ordem original das linhas
+    df_out = pd.concat([linhas_margens, linhas_sem_margens]).sort_index(kind='stable')
+
+    if df_out.empty:
         print('Nenhum registro extraído — salvando cópia do original.')
-        df.to_excel(path_saida, index=False, engine='openpyxl')
+        salvar_excel(df, path_saida)
         return
 
-    df_out = pd.DataFrame(linhas_saida)
+    # colunas sem nenhum valor ficam de fora (os campos do item de margem, quando presentes, sempre entram)
+    vazias = df_out.columns[df_out.isna().all()].difference(campos.columns)
+    if df_out[COLUNAS_MOTIVO_SAIDA].notna().any().any():
+        vazias = vazias.difference(COLUNAS_MOTIVO_SAIDA)
+    df_out = tipar_colunas_saida(df_out.drop(columns=vazias).reset_index(drop=True))
 
     # Reordena um conjunto de colunas úteis se existirem
     prioridade = ['Parceiro', 'Data de abertura da proposta', 'NÃºmero da Proposta', 'Status da Proposta',
@@ -544,7 +725,7 @@ def processar_arquivo(path_entrada: Union[str, Path], path_saida: Union[str, Pat
     cols += [c for c in df_out.columns if c not in cols]
     df_out = df_out[cols]
 
-    df_out.to_excel(path_saida, index=False, engine='openpyxl')
+    salvar_excel(df_out, path_saida)
 
 
 def main():
@@ -604,5 +785,7 @@ def main():
 
 
 if __name__ == '__main__':
+    # necessário para o ProcessPoolExecutor no executável (PyInstaller/Windows)
+    freeze_support()
     main()
 